@@ -1,13 +1,15 @@
 import os
-import json
+import orjson
+import hashlib
 import logging
-from datetime import datetime
+from collections import OrderedDict
 from dotenv import load_dotenv
 import streamlit as st
 from rag import RAGSystem
 from memory import PersistentChatMemory
 from langchain_community.llms import Ollama
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import HumanMessage
 from langchain.chains.combine_documents import create_stuff_documents_chain
 import warnings
 
@@ -32,6 +34,12 @@ Historial de chat:
 Pregunta: {input}
 Respuesta:"""
 
+# Número de mensajes recientes que se renderizan en cada rerun
+HISTORY_PAGE_SIZE = 20
+
+# Máximo de respuestas del LLM guardadas por sesión
+RESPONSE_CACHE_SIZE = 128
+
 def initialize_session_state():
     """Inicializa el estado de la sesión con manejo robusto"""
     try:
@@ -42,7 +50,7 @@ def initialize_session_state():
 
         # 2. Inicializar memoria persistente
         if "memory" not in st.session_state:
-            mem_path = os.path.abspath("chat_memory.json")
+            mem_path = os.path.abspath("chat_memory.jsonl")
             st.session_state.memory = PersistentChatMemory(path=mem_path)
             st.toast(f"💾 Memoria cargada desde: {mem_path}")
             logger.info(f"Memoria persistente inicializada en: {mem_path}")
@@ -52,6 +60,10 @@ def initialize_session_state():
             st.session_state.messages = []
             load_chat_history()
 
+        # 4. Inicializar caché de respuestas
+        if "response_cache" not in st.session_state:
+            st.session_state.response_cache = OrderedDict()
+
     except Exception as e:
         logger.error(f"❌ Error al inicializar sesión: {str(e)}")
         st.error("Error al inicializar la aplicación. Recarga la página.")
@@ -59,12 +71,15 @@ def initialize_session_state():
 def load_chat_history():
     """Carga el historial de chat desde la memoria persistente"""
     try:
-        # Cargar desde el archivo JSON directamente como respaldo
-        if os.path.exists("chat_memory.json"):
-            with open("chat_memory.json", "r", encoding="utf-8") as f:
-                messages_data = json.load(f)
-                
-                for msg in messages_data:
+        # Cargar desde el log JSONL directamente como respaldo
+        if os.path.exists("chat_memory.jsonl"):
+            with open("chat_memory.jsonl", "rb") as f:
+                for line in f:
+                    try:
+                        msg = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        continue
+                    
                     if not isinstance(msg, dict):
                         continue
                         
@@ -76,47 +91,75 @@ def load_chat_history():
 
         # Cargar desde la memoria de LangChain
         langchain_messages = st.session_state.memory.memory.chat_memory.messages
+        seen = {m["content"] for m in st.session_state.messages}
         for msg in langchain_messages:
             try:
                 content = msg.content
                 role = "user" if isinstance(msg, HumanMessage) else "assistant"
-                if content and not any(m["content"] == content for m in st.session_state.messages):
+                if content and content not in seen:
                     st.session_state.messages.append({"role": role, "content": content})
+                    seen.add(content)
             except Exception as e:
                 logger.warning(f"⚠️ Error cargando mensaje de LangChain: {str(e)}")
 
     except Exception as e:
         logger.error(f"❌ Error cargando historial: {str(e)}")
 
-def backup_message_to_json(user_input: str, assistant_output: str):
-    """Guarda mensajes directamente en JSON como backup redundante"""
-    backup_path = "chat_backup.json"
-    try:
-        messages = []
-        
-        # Cargar mensajes existentes
-        if os.path.exists(backup_path):
-            with open(backup_path, "r", encoding="utf-8") as f:
-                messages = json.load(f)
-        
-        # Añadir nuevos mensajes
-        messages.append({
-            "type": "human",
-            "content": user_input,
-            "timestamp": str(datetime.now())
-        })
-        messages.append({
-            "type": "ai",
-            "content": assistant_output,
-            "timestamp": str(datetime.now())
-        })
-        
-        # Guardar
-        with open(backup_path, "w", encoding="utf-8") as f:
-            json.dump(messages, f, indent=2)
-            
-    except Exception as e:
-        logger.error(f"⚠️ Error en backup JSON: {str(e)}")
+def render_chat_history():
+    """Muestra los mensajes recientes; los anteriores solo se renderizan bajo demanda"""
+    messages = st.session_state.messages
+    earlier = messages[:-HISTORY_PAGE_SIZE]
+
+    if earlier and st.toggle("Mostrar conversación anterior", key="show_earlier"):
+        for message in earlier:
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
+
+    for message in messages[-HISTORY_PAGE_SIZE:]:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+
+def generate_response(prompt: str, docs: list) -> str:
+    """Genera la respuesta del LLM, reutilizando la de una pregunta idéntica con el mismo contexto"""
+    docs_hash = hashlib.blake2b(
+        "|".join(d.page_content for d in docs).encode("utf-8"), digest_size=8
+    ).hexdigest()
+    key = (
+        prompt,
+        docs_hash,
+        st.session_state.temperature,
+        st.session_state.top_p,
+        st.session_state.top_k
+    )
+
+    cache = st.session_state.response_cache
+    if key in cache:
+        cache.move_to_end(key)
+        logger.info("♻️ Respuesta obtenida de la caché")
+        return cache[key]
+
+    # Configurar LLM
+    llm = Ollama(
+        model="llama3",
+        temperature=st.session_state.temperature,
+        top_p=st.session_state.top_p,
+        top_k=st.session_state.top_k
+    )
+
+    # Crear y ejecutar cadena
+    prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+    chain = create_stuff_documents_chain(llm, prompt_template)
+
+    response = chain.invoke({
+        "input": prompt,
+        "context": docs,
+        "chat_history": st.session_state.memory.load_memory_variables({})
+    })
+
+    cache[key] = response
+    if len(cache) > RESPONSE_CACHE_SIZE:
+        cache.popitem(last=False)
+    return response
 
 def setup_sidebar():
     """Configura el panel lateral"""
@@ -129,6 +172,7 @@ def setup_sidebar():
         if st.button("🧹 Limpiar memoria"):
             st.session_state.memory.clear()
             st.session_state.messages = []
+            st.session_state.response_cache.clear()
             st.success("🧠 Memoria limpiada")
             st.rerun()
 
@@ -160,9 +204,7 @@ def main():
             st.error(f"❌ Error al procesar el PDF: {str(e)}")
 
     # Mostrar historial de mensajes
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    render_chat_history()
 
     # Procesar entrada del usuario
     if prompt := st.chat_input("Haz una pregunta sobre el documento"):
@@ -174,23 +216,8 @@ def main():
             # Obtener documentos relevantes
             docs = st.session_state.rag.query(prompt)
 
-            # Configurar LLM
-            llm = Ollama(
-                model="llama3",
-                temperature=st.session_state.temperature,
-                top_p=st.session_state.top_p,
-                top_k=st.session_state.top_k
-            )
-
-            # Crear y ejecutar cadena
-            prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-            chain = create_stuff_documents_chain(llm, prompt_template)
-
-            response = chain.invoke({
-                "input": prompt,
-                "context": docs,
-                "chat_history": st.session_state.memory.load_memory_variables({})
-            })
+            # Generar respuesta
+            response = generate_response(prompt, docs)
 
             # Mostrar respuesta
             with st.chat_message("assistant"):
@@ -204,7 +231,6 @@ def main():
             st.session_state.messages.append({"role": "assistant", "content": response})
             
             st.session_state.memory.save_context(input_data, output_data)
-            backup_message_to_json(prompt, response)
 
         except Exception as e:
             st.error(f"⚠️ Error al generar respuesta: {str(e)}")
@@ -0,0 +1,96 @@
+import os
+import logging
+import threading
+from typing import List
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer
+from langchain_core.embeddings import Embeddings
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ONNXEmbeddings(Embeddings):
+    def __init__(self, model_name: str, cache_dir: str, max_length: int = 128, batch_size: int = 64):
+        """Carga el modelo exportado a ONNX (int8) y abre una sesión de ONNX Runtime"""
+        self.max_length = max_length
+        self.batch_size = batch_size
+        # La instancia es compartida entre sesiones y cambiar el padding muta el tokenizer
+        self._tokenizer_lock = threading.Lock()
+        
+        try:
+            model_path = os.path.join(cache_dir, "model_quantized.onnx")
+            if not os.path.exists(model_path):
+                self._export(model_name, cache_dir)
+                
+            self.tokenizer = AutoTokenizer.from_pretrained(cache_dir)
+            
+            sess_options = ort.SessionOptions()
+            sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self.session = ort.InferenceSession(
+                model_path,
+                sess_options=sess_options,
+                providers=["CPUExecutionProvider"]
+            )
+            self.input_names = {i.name for i in self.session.get_inputs()}
+            logger.info(f"✅ Modelo ONNX cargado desde: {model_path}")
+            
+        except Exception as e:
+            logger.error(f"❌ Error al cargar modelo ONNX: {str(e)}")
+            raise
+
+    @staticmethod
+    def _export(model_name: str, cache_dir: str) -> None:
+        """Exporta el modelo a ONNX y lo cuantiza dinámicamente a int8"""
+        logger.info(f"⏳ Exportando {model_name} a ONNX en: {cache_dir}")
+        model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+        model.save_pretrained(cache_dir)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(cache_dir)
+        
+        quantizer = ORTQuantizer.from_pretrained(cache_dir, file_name="model.onnx")
+        quantizer.quantize(
+            save_dir=cache_dir,
+            quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        )
+
+    def _encode(self, texts: List[str], fixed_shape: bool = False) -> np.ndarray:
+        """Tokeniza y ejecuta la sesión una vez por lote, con mean pooling y normalización L2"""
+        # Con forma fija ONNX Runtime reutiliza sus buffers entre lotes del mismo tamaño
+        padding = "max_length" if fixed_shape else True
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            with self._tokenizer_lock:
+                enc = self.tokenizer(
+                    batch,
+                    padding=padding,
+                    truncation=True,
+                    max_length=self.max_length,
+                    return_tensors="np"
+                )
+            # La sesión espera int64; numpy usa int32 por defecto en Windows. Sin copia si ya es int64
+            feed = {name: enc[name].astype(np.int64, copy=False) for name in self.input_names if name in enc}
+            if "token_type_ids" in self.input_names and "token_type_ids" not in feed:
+                feed["token_type_ids"] = np.zeros_like(feed["input_ids"])
+                
+            hidden = self.session.run(None, feed)[0]
+            
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.append(pooled)
+            
+        return np.vstack(vectors)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Calcula embeddings de una lista de documentos"""
+        if not texts:
+            return []
+        return self._encode(texts, fixed_shape=True).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Calcula el embedding de una consulta"""
+        return self._encode([text])[0].tolist()
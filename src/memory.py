@@ -1,7 +1,7 @@
 import os
-import json
+import orjson
 from typing import List, Dict, Any, Optional
-from langchain.memory import ConversationBufferMemory
+from langchain.memory import ConversationBufferWindowMemory
 from langchain_core.messages import messages_from_dict, message_to_dict
 from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.messages.base import BaseMessage
@@ -11,17 +11,25 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Número de escrituras incrementales antes de compactar el log completo
+COMPACT_EVERY = 50
+
+# Turnos recientes que se pasan al LLM; el historial completo se conserva en disco
+HISTORY_WINDOW = 8
+
 class PersistentChatMemory:
     def __init__(self, path: Optional[str] = None):
         """Inicializa memoria persistente con manejo robusto de errores"""
         self.path = os.path.abspath(path) if path else os.path.join(
-            os.getcwd(), "chat_memory.json"
+            os.getcwd(), "chat_memory.jsonl"
         )
+        self._writes_since_compact = 0
         
         try:
             os.makedirs(os.path.dirname(self.path), exist_ok=True)
             
-            self.memory = ConversationBufferMemory(
+            self.memory = ConversationBufferWindowMemory(
+                k=HISTORY_WINDOW,
                 memory_key="chat_history",
                 return_messages=True,
                 input_key="input",
@@ -36,44 +44,67 @@ class PersistentChatMemory:
             raise
 
     def _verify_and_load(self) -> None:
-        """Carga y valida el archivo de memoria"""
+        """Carga y valida el log JSONL de memoria, una línea por mensaje"""
         if not os.path.exists(self.path):
+            legacy_path = f"{os.path.splitext(self.path)[0]}.json"
+            if self.path.endswith(".jsonl") and os.path.exists(legacy_path):
+                self._import_legacy(legacy_path)
+                return
             logger.info("ℹ️ No se encontró archivo de memoria. Se creará uno nuevo.")
             return
             
         try:
-            with open(self.path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                
-            if not isinstance(data, list):
-                raise ValueError("Formato inválido: debe ser lista")
-                
-            validated_messages = []
-            for item in data:
-                if not isinstance(item, dict):
-                    continue
+            raw_messages = []
+            last_line = b""
+            with open(self.path, "rb") as f:
+                for line_no, line in enumerate(f, 1):
+                    last_line = line
+                    line = line.strip()
+                    if not line:
+                        continue
                     
-                # Extraer contenido y tipo de forma robusta
-                content = item.get("data", {}).get("content", item.get("content", "")).strip()
-                msg_type = item.get("type", "")
-                
-                if not content:
-                    continue
-                    
-                if msg_type == "human" or "HumanMessage" in str(item):
-                    validated_messages.append(HumanMessage(content=content))
-                elif msg_type == "ai" or "AIMessage" in str(item):
-                    validated_messages.append(AIMessage(content=content))
+                    # Una línea truncada (p. ej. cierre abrupto) no invalida el resto del log
+                    try:
+                        raw_messages.append(orjson.loads(line))
+                    except orjson.JSONDecodeError:
+                        logger.warning(f"⚠️ Línea {line_no}: JSON inválido, omitiendo")
             
             # Asignar todos los mensajes válidos de una vez
+            validated_messages = self._validate_messages(raw_messages)
             if validated_messages:
                 self.memory.chat_memory.messages = validated_messages
                 logger.info(f"📖 Cargados {len(validated_messages)} mensajes válidos")
                 
+            # Sin salto de línea final la próxima escritura se pegaría a la última línea
+            if last_line and not last_line.endswith(b"\n"):
+                logger.warning("⚠️ El log no termina en salto de línea. Cerrando la última línea")
+                with open(self.path, "ab") as f:
+                    f.write(b"\n")
+                
         except Exception as e:
             logger.error(f"⚠️ Error al cargar memoria: {str(e)}")
             self._backup_and_reset()
 
+    def _import_legacy(self, legacy_path: str) -> None:
+        """Importa una sola vez el historial del antiguo formato JSON (lista) al log JSONL"""
+        try:
+            with open(legacy_path, "rb") as f:
+                data = orjson.loads(f.read())
+                
+            if not isinstance(data, list):
+                raise ValueError("Formato inválido: debe ser lista")
+                
+            validated_messages = self._validate_messages(data)
+            if validated_messages:
+                self.memory.chat_memory.messages = validated_messages
+            self._atomic_save()
+            logger.info(f"📦 Importados {len(validated_messages)} mensajes desde: {legacy_path}")
+            
+        except Exception as e:
+            # El archivo antiguo se conserva intacto para reintentar la importación
+            logger.error(f"⚠️ Error al importar memoria antigua: {str(e)}")
+            self.memory.clear()
+
     def _validate_messages(self, raw_messages: List[Dict[str, Any]]) -> List[BaseMessage]:
         """Valida y filtra mensajes crudos"""
         validated = []
@@ -83,8 +114,10 @@ class PersistentChatMemory:
                 logger.warning(f"⚠️ Entrada {idx}: No es un diccionario, omitiendo")
                 continue
                 
-            msg_type = item.get("type")
-            content = item.get("content", "").strip()
+            # Extraer contenido y tipo de forma robusta
+            data = item.get("data", {})
+            content = data.get("content", item.get("content", "")).strip()
+            msg_type = item.get("type") or data.get("type")
             
             if not content:
                 logger.warning(f"⚠️ Entrada {idx}: Mensaje sin contenido, omitiendo")
@@ -125,24 +158,34 @@ class PersistentChatMemory:
                 raise ValueError("Los datos deben contener 'input' y 'output' no vacíos")
                 
             self.memory.save_context(input_data, output_data)
-            self._atomic_save()
+            self._append_messages(self.memory.chat_memory.messages[-2:])
         except Exception as e:
             logger.error(f"⚠️ Error al guardar contexto: {str(e)}")
             raise
 
+    def _append_messages(self, messages: List[BaseMessage]) -> None:
+        """Añade solo los mensajes nuevos al log y compacta cada COMPACT_EVERY escrituras"""
+        with open(self.path, "ab", buffering=64 * 1024) as f:
+            for m in messages:
+                if getattr(m, "content", None):
+                    f.write(orjson.dumps(message_to_dict(m)) + b"\n")
+        
+        self._writes_since_compact += 1
+        if self._writes_since_compact >= COMPACT_EVERY:
+            self._atomic_save()
+
     def _atomic_save(self) -> None:
-        """Guarda atómicamente usando patrón tempfile"""
+        """Compacta el log reescribiéndolo atómicamente usando patrón tempfile"""
         temp_path = f"{self.path}.tmp"
         try:
             messages = [m for m in self.memory.chat_memory.messages if getattr(m, "content", None)]
-            data = [message_to_dict(m) for m in messages]
             
-            with open(temp_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            with open(temp_path, "wb") as f:
+                for m in messages:
+                    f.write(orjson.dumps(message_to_dict(m)) + b"\n")
                 
-            if os.path.exists(self.path):
-                os.remove(self.path)
-            os.rename(temp_path, self.path)
+            os.replace(temp_path, self.path)
+            self._writes_since_compact = 0
             
         except Exception as e:
             logger.error(f"❌ Error crítico al guardar: {str(e)}")
@@ -164,6 +207,7 @@ class PersistentChatMemory:
     def clear(self) -> None:
         """Limpia completamente la memoria"""
         self.memory.clear()
+        self._writes_since_compact = 0
         try:
             if os.path.exists(self.path):
                 os.remove(self.path)
@@ -1,16 +1,53 @@
-from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from embeddings import ONNXEmbeddings
 import chromadb
+import pypdfium2 as pdfium
+import streamlit as st
 import os
+import hashlib
 import logging
-from typing import List
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterator, List
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Tamaño de lote para el cálculo de embeddings
+EMBED_BATCH_SIZE = 64
+
+# Colección de los embeddings ONNX int8. La antigua "pdf_documents" (PyTorch FP32) no se
+# reutiliza: mezclaría dos espacios de embeddings en las búsquedas
+COLLECTION_NAME = "pdf_chunks_onnx"
+
+# Registro de PDF ya indexados: un registro por doc_hash con su número de fragmentos
+REGISTRY_NAME = "pdf_chunks_onnx_registry"
+
+# PDFium no admite llamadas concurrentes desde distintos hilos, ni siquiera sobre
+# documentos distintos; cada sesión de Streamlit ejecuta su script en su propio hilo
+_PDFIUM_LOCK = threading.Lock()
+
+class _RAGResources:
+    def __init__(self, chroma_path: str):
+        """Agrupa el cliente de ChromaDB y el modelo de embeddings (ONNX Runtime en CPU)"""
+        self.client = chromadb.PersistentClient(path=chroma_path)
+        self.embeddings = ONNXEmbeddings(
+            model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+            cache_dir=os.path.abspath("./onnx_model"),
+            batch_size=EMBED_BATCH_SIZE
+        )
+
+# Una única instancia por proceso: la RAM del modelo no crece con el número de sesiones,
+# así que no se expulsa (con ttl cada sesión nueva cargaría otra copia del modelo)
+@st.cache_resource
+def _get_resources(chroma_path: str) -> _RAGResources:
+    """Recursos pesados compartidos por todas las sesiones del proceso"""
+    return _RAGResources(chroma_path)
+
 class RAGSystem:
     def __init__(self):
         """Inicialización robusta del sistema RAG con manejo de errores"""
@@ -18,15 +55,12 @@ class RAGSystem:
             # Configuración de ChromaDB
             self.chroma_path = os.path.abspath("./chroma_db")
             os.makedirs(self.chroma_path, exist_ok=True)
-            self.client = chromadb.PersistentClient(path=self.chroma_path)
+            resources = _get_resources(self.chroma_path)
+            self.client = resources.client
             logger.info(f"✅ ChromaDB inicializado en: {self.chroma_path}")
 
-            # Configuración de embeddings (forzando CPU)
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name="paraphrase-multilingual-MiniLM-L12-v2",
-                model_kwargs={'device': 'cpu'},
-                encode_kwargs={'normalize_embeddings': True}
-            )
+            # Configuración de embeddings
+            self.embeddings = resources.embeddings
             logger.info("✅ Embeddings configurados correctamente")
 
             # Configuración del text splitter
@@ -43,26 +77,114 @@ class RAGSystem:
             raise
 
     def process_pdf(self, file_path: str) -> int:
-        """Procesa un PDF y lo carga en la base de datos vectorial"""
+        """Procesa un PDF y lo añade a la base de datos vectorial"""
         try:
-            loader = PyPDFLoader(file_path)
-            pages = loader.load_and_split()
-            chunks = self.text_splitter.split_documents(pages)
+            # Todos los PDF comparten una colección; el índice HNSW crece de forma incremental
+            if self.vector_db is None:
+                self.vector_db = Chroma(
+                    client=self.client,
+                    collection_name=COLLECTION_NAME,
+                    embedding_function=self.embeddings,
+                    collection_metadata={"hnsw:space": "cosine", "hnsw:construction_ef": 100}
+                )
+            collection = self.vector_db._collection
             
-            self.vector_db = Chroma.from_documents(
-                documents=chunks,
-                embedding=self.embeddings,
-                client=self.client,
-                collection_name="pdf_documents",
-                collection_metadata={"hnsw:space": "cosine"}
+            # Los fragmentos compartidos conservan el doc_hash del primer PDF que los aportó,
+            # así que el estado "indexado" se guarda aparte, con un vector ficticio de dimensión 1
+            registry = self.client.get_or_create_collection(
+                name=REGISTRY_NAME,
+                embedding_function=None
             )
-            logger.info(f"📄 Documento procesado: {len(chunks)} fragmentos")
-            return len(chunks)
+            
+            # Cada PDF se identifica por el hash de su contenido
+            with open(file_path, "rb") as f:
+                doc_hash = hashlib.sha256(f.read()).hexdigest()[:16]
+            
+            indexed = registry.get(ids=[doc_hash], include=["metadatas"])
+            if indexed["ids"]:
+                count = indexed["metadatas"][0]["chunks"]
+                logger.info(f"♻️ Documento ya indexado: {count} fragmentos")
+                return count
+            
+            # Los fragmentos se embeben y guardan por lotes en un hilo aparte mientras
+            # el hilo principal extrae y divide las páginas del siguiente lote
+            count = 0
+            added = 0
+            try:
+                chunks = self._iter_chunks(file_path, doc_hash)
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    pending = None
+                    while batch := list(islice(chunks, EMBED_BATCH_SIZE)):
+                        if pending:
+                            added += pending.result()
+                        pending = executor.submit(self._add_new_chunks, batch)
+                        count += len(batch)
+                    if pending:
+                        added += pending.result()
+            except Exception:
+                # Deshacer los fragmentos que aportó este documento; no queda registrado como indexado
+                collection.delete(where={"doc_hash": doc_hash})
+                raise
+            
+            registry.upsert(
+                ids=[doc_hash],
+                embeddings=[[0.0]],
+                metadatas=[{"chunks": count, "source": file_path}]
+            )
+            logger.info(f"📄 Documento procesado: {count} fragmentos ({added} nuevos)")
+            return count
             
         except Exception as e:
             logger.error(f"❌ Error al procesar PDF: {str(e)}")
             raise
 
+    def _iter_chunks(self, file_path: str, doc_hash: str) -> Iterator[Document]:
+        """Extrae el texto con PDFium y genera los fragmentos página a página"""
+        # El lock se toma por operación y nunca se mantiene durante un yield
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(file_path)
+            n_pages = len(pdf)
+        try:
+            for i in range(n_pages):
+                with _PDFIUM_LOCK:
+                    page = pdf[i]
+                    textpage = page.get_textpage()
+                    text = textpage.get_text_range()
+                    textpage.close()
+                    page.close()
+                
+                # PDFium separa líneas con "\r\n"; sin normalizar, el separador "\n\n"
+                # del splitter nunca coincidiría con un salto de párrafo
+                text = text.replace("\r\n", "\n").replace("\r", "\n")
+                page_doc = Document(
+                    page_content=text,
+                    metadata={"source": file_path, "page": i, "doc_hash": doc_hash}
+                )
+                yield from self.text_splitter.split_documents([page_doc])
+        finally:
+            with _PDFIUM_LOCK:
+                pdf.close()
+
+    def _add_new_chunks(self, batch: List[Document]) -> int:
+        """Embebe y añade solo los fragmentos cuyo contenido aún no está indexado"""
+        # El id de cada fragmento es el hash de su contenido
+        ids = [
+            hashlib.blake2b(c.page_content.encode("utf-8"), digest_size=16).hexdigest()
+            for c in batch
+        ]
+        existing = set(self.vector_db._collection.get(ids=ids, include=[])["ids"])
+        
+        new_chunks, new_ids = [], []
+        for chunk, chunk_id in zip(batch, ids):
+            if chunk_id not in existing:
+                existing.add(chunk_id)
+                new_chunks.append(chunk)
+                new_ids.append(chunk_id)
+                
+        if new_chunks:
+            self.vector_db.add_documents(new_chunks, ids=new_ids)
+        return len(new_chunks)
+
     def query(self, question: str, k: int = 3) -> List[str]:
         """Consulta la base de datos vectorial"""
         if not self.vector_db:
@@ -1,5 +1,5 @@
 try:
-    from langchain_community.document_loaders import PyPDFLoader
+    import pypdfium2
     from langchain_community.llms import Ollama
     print("¡Todos los imports funcionan correctamente!")
 except ImportError as e:
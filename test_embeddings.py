@@ -1,8 +1,12 @@
-from langchain_community.embeddings import HuggingFaceEmbeddings
+import os
+import sys
 
-embeddings = HuggingFaceEmbeddings(
-    model_name="paraphrase-multilingual-MiniLM-L12-v2",
-    model_kwargs={'device': 'cpu'}
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from embeddings import ONNXEmbeddings
+
+embeddings = ONNXEmbeddings(
+    model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+    cache_dir=os.path.abspath("./onnx_model")
 )
 result = embeddings.embed_documents(["test document"])
 print("¡Funciona!" if len(result[0]) == 384 else "Error")
\ No newline at end of file